@@ -0,0 +1,87 @@
+# _nearest.py
+"""
+Nearest-job search kernel used by app.py.
+
+With numba installed the search is JIT-compiled into one fused loop
+(trig + reduction + argmin, no (V, J) temporaries) parallelized across
+vehicles. Candidates are compared on the haversine intermediate and
+pruned by latitude against the best so far, so only the winner pays for
+the asin/sqrt. Without numba the same functions run as plain Python, so
+callers should check HAVE_NUMBA and prefer a numpy path instead.
+"""
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit."""
+        def decorate(fn):
+            return fn
+        return decorate
+
+EARTH_RADIUS_MI = 3958.7613
+
+
+@njit(fastmath=True, cache=True)
+def _haversine_a(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2):
+    """
+    Haversine intermediate a = sin²(dlat/2) + cos(lat1)cos(lat2)sin²(dlon/2)
+    for two points in radians. Monotone in distance, so nearest-neighbour
+    comparisons can skip the asin/sqrt.
+    """
+    s_dlat = math.sin((lat2 - lat1) / 2.0)
+    s_dlon = math.sin((lon2 - lon1) / 2.0)
+    return s_dlat * s_dlat + cos_lat1 * cos_lat2 * s_dlon * s_dlon
+
+
+@njit(fastmath=True, cache=True)
+def _central_angle(a):
+    """Central angle in radians for a haversine intermediate `a`."""
+    return 2.0 * math.asin(math.sqrt(min(a, 1.0)))
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def nearest_job(vlat, vlon, jlat, jlon, cos_jlat):
+    """
+    For each vehicle, find the nearest job.
+
+    All inputs are contiguous float64 arrays in radians, plus cos(jlat)
+    precomputed by the caller; jlat/jlon must be non-empty. Returns
+    (idx, dist_mi): the index into the job arrays and the distance to it
+    in miles, one entry per vehicle.
+    """
+    n_v = vlat.shape[0]
+    n_j = jlat.shape[0]
+    out_idx = np.empty(n_v, dtype=np.int64)
+    out_dist = np.empty(n_v, dtype=np.float64)
+
+    for i in prange(n_v):
+        lat1 = vlat[i]
+        lon1 = vlon[i]
+        cos_lat1 = math.cos(lat1)
+
+        # Seed with job 0 rather than inf: fastmath assumes no infinities
+        best_a = _haversine_a(lat1, lon1, cos_lat1, jlat[0], jlon[0], cos_jlat[0])
+        best_j = 0
+        # a >= sin²(|dlat|/2), so a job further than the current best in
+        # latitude alone cannot win and is rejected before any trig
+        dlat_bound = _central_angle(best_a)
+        for j in range(1, n_j):
+            if abs(jlat[j] - lat1) > dlat_bound:
+                continue
+            a = _haversine_a(lat1, lon1, cos_lat1, jlat[j], jlon[j], cos_jlat[j])
+            if a < best_a:
+                best_a = a
+                best_j = j
+                dlat_bound = _central_angle(best_a)
+        out_idx[i] = best_j
+        out_dist[i] = EARTH_RADIUS_MI * _central_angle(best_a)
+
+    return out_idx, out_dist
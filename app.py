@@ -1,84 +1,246 @@
 # app.py
 import os
 import math
+from dataclasses import dataclass
+from typing import Optional
+
 import pandas as pd
 import numpy as np
 import streamlit as st
 import pydeck as pdk
 
+# Optional speedups, all picked up automatically when installed:
+#   pyarrow      - faster CSV parsing in load_data (falls back to pandas' C engine)
+#   scikit-learn - BallTree nearest-job search (falls back to _nearest / numpy)
+#   numba        - JIT nearest-job kernel in _nearest.py
+#   numexpr      - fused haversine_miles evaluation
+from _nearest import EARTH_RADIUS_MI, HAVE_NUMBA, nearest_job
+
+try:
+    from sklearn.neighbors import BallTree
+except ImportError:
+    BallTree = None  # scikit-learn not installed; fall back to the dense distance matrix
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as pads
+except ImportError:
+    pads = None  # pyarrow not installed; latest-per-vehicle is computed in pandas
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None  # numexpr not installed; haversine_miles uses plain numpy
 
 # ---------- CONFIG ----------
 os.environ["MAPBOX_API_KEY"] = "pk.eyJ1IjoiYnJhbmRvbm5hbmNlIiwiYSI6ImNtaHdmNG52ZjA1c2Iya3B2MmQ4ZHZlM2IifQ.8A-1uK_195w6igptwfkRZA"
 DATA_DIR = r"C:\Users\Brandon\Documents\DEV\VehicleTracker"
 VEHICLE_CSV = os.path.join(DATA_DIR, "data.csv")  # from your Samsara fetcher
 JOBS_CSV    = os.path.join(DATA_DIR, "jobs.csv")  # your curated jobs file
+MAP_AGGREGATE_OVER = 2000  # above this many vehicles, "Other" is drawn as hexagon bins
 
 # ---------- HELPERS ----------
-def haversine_miles(lat1, lon1, lat2, lon2):
+def haversine_miles(lat1, lon1, lat2, lon2, cos_lat2=None):
     """
     Vectorized Haversine distance in miles.
-    lat/lon can be numpy arrays/pandas Series of equal shape.
+    lat/lon can be numpy arrays/pandas Series of equal (or broadcastable) shape.
+    Computed in float32: GPS inputs only carry ~1 m of precision anyway, and
+    single precision halves the temporaries and doubles SIMD trig throughput.
+    cos_lat2 optionally supplies a precomputed cos(radians(lat2)), e.g. JobIndex.cos_lat.
     """
-    R = 3958.7613  # Earth radius in miles
-    lat1 = np.radians(lat1)
-    lon1 = np.radians(lon1)
-    lat2 = np.radians(lat2)
-    lon2 = np.radians(lon2)
+    R = np.float32(EARTH_RADIUS_MI)
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float32))
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float32))
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float32))
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float32))
+    cos_lat2 = np.cos(lat2) if cos_lat2 is None else np.asarray(cos_lat2, dtype=np.float32)
+    if ne is not None:
+        # Single fused, multi-threaded pass instead of ~7 full-size temporaries
+        return ne.evaluate(
+            "2*R*arcsin(sqrt(sin((lat2-lat1)/2)**2"
+            " + cos(lat1)*cos_lat2*sin((lon2-lon1)/2)**2))",
+            local_dict={"lat1": lat1, "lon1": lon1, "lat2": lat2, "lon2": lon2,
+                        "cos_lat2": cos_lat2, "R": R},
+        )
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
+    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * cos_lat2 * np.sin(dlon/2.0)**2
     c = 2 * np.arcsin(np.sqrt(a))
     return R * c
 
+# Columns needed to reduce the ping log to the latest ping per vehicle
+LATEST_KEY_COLS = ["vehicleId", "timestamp", "latitude", "longitude"]
+
 def latest_vehicle_positions(df):
     """
     Keep only the most recent ping per vehicleId.
     Expects columns: vehicleId, timestamp, latitude, longitude, odometer
     """
-    # Convert timestamp; infer format and coerce errors
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
+    # Convert timestamp (Samsara sends ISO-8601); coerce errors
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601", errors="coerce", utc=True)
     # Drop rows without coordinates or timestamp
     df = df.dropna(subset=["timestamp", "latitude", "longitude"])
-    # Sort by timestamp descending, then keep first per vehicleId
-    df = df.sort_values("timestamp", ascending=False)
-    latest = df.groupby("vehicleId", as_index=False).first()
+    # Row of the max timestamp per vehicleId (single pass, no global sort)
+    idx = df.groupby("vehicleId", sort=False, observed=True)["timestamp"].idxmax()
+    latest = df.loc[idx].reset_index(drop=True)
     return latest
 
+@dataclass(frozen=True)
+class JobIndex:
+    """Job coordinates preprocessed once per jobs table for the nearest-job search."""
+    lat_rad: np.ndarray
+    lon_rad: np.ndarray
+    cos_lat: np.ndarray
+    tree: Optional["BallTree"] = None  # haversine BallTree when scikit-learn is installed
+
+@st.cache_resource(show_spinner=False)
+def build_job_index(job_lats, job_lons):
+    """
+    Radians, cos(lat) and (if available) a haversine BallTree for the jobs.
+    Cached so none of it is recomputed until the jobs themselves change.
+    """
+    lat_rad = np.ascontiguousarray(np.radians(job_lats))
+    lon_rad = np.ascontiguousarray(np.radians(job_lons))
+    tree = None
+    if BallTree is not None and len(lat_rad) > 0:
+        tree = BallTree(np.column_stack([lat_rad, lon_rad]), metric="haversine", leaf_size=16)
+    return JobIndex(lat_rad=lat_rad, lon_rad=lon_rad, cos_lat=np.cos(lat_rad), tree=tree)
+
+@st.cache_data(show_spinner=False)
+def nearest_jobs(vehicles_latest, jobs):
+    """
+    For each vehicle, find nearest job and distance.
+    Independent of the threshold, so slider changes reuse the cached result.
+    """
+    # Prepare arrays
+    vlat = vehicles_latest["latitude"].to_numpy(dtype=np.float64)
+    vlon = vehicles_latest["longitude"].to_numpy(dtype=np.float64)
+    job_lats = jobs["latitude"].to_numpy(dtype=np.float64)
+    job_lons = jobs["longitude"].to_numpy(dtype=np.float64)
+    job_index = build_job_index(job_lats, job_lons)
+
+    if job_index.tree is not None and len(vehicles_latest) > 0:
+        # O(V log J) nearest-neighbour query; distances come back in radians
+        dist_rad, nn = job_index.tree.query(np.deg2rad(np.column_stack([vlat, vlon])), k=1)
+        idx = nn[:, 0]
+        nearest_dist_mi = dist_rad[:, 0] * EARTH_RADIUS_MI
+    elif HAVE_NUMBA and len(jobs) > 0:
+        # Fused JIT kernel: trig + argmin in one parallel pass, no (V, J) matrix
+        idx, nearest_dist_mi = nearest_job(
+            np.ascontiguousarray(np.radians(vlat)), np.ascontiguousarray(np.radians(vlon)),
+            job_index.lat_rad, job_index.lon_rad, job_index.cos_lat,
+        )
+    else:
+        # (V, J) distance matrix in one broadcast pass, then nearest job per row
+        dists = haversine_miles(vlat[:, None], vlon[:, None],
+                                job_lats[None, :], job_lons[None, :],
+                                cos_lat2=job_index.cos_lat[None, :])
+        idx = dists.argmin(axis=1)
+        # Back to float64 so rounding yields clean values for the table/tooltip
+        nearest_dist_mi = dists[np.arange(len(vehicles_latest)), idx].astype(np.float64)
+
+    # Categorical job columns: int codes into the jobs instead of one Python
+    # string per vehicle. "Other" is registered up front (categories sorted
+    # like the plain strings were) so assign_to_jobs can bucket by code.
+    name_cats = (pd.Index(jobs["job_name"]).append(pd.Index(["Other"]))
+                 .dropna().unique().sort_values())
+    # assign() returns the new frame in one step instead of copy-then-mutate
+    return vehicles_latest.assign(
+        nearest_job_id=pd.Categorical(jobs["job_id"]).take(idx),
+        nearest_job_name=pd.Categorical(jobs["job_name"], categories=name_cats).take(idx),
+        nearest_distance_mi=np.round(nearest_dist_mi, 3),
+    )
+
 def assign_to_jobs(vehicles_latest, jobs, threshold_miles):
     """
     For each vehicle, find nearest job and distance.
     If distance > threshold, bucket as 'Other'.
     Returns a DataFrame with assignment columns.
     """
-    v = vehicles_latest.copy()
-    # Prepare arrays
-    job_lats = jobs["latitude"].to_numpy()
-    job_lons = jobs["longitude"].to_numpy()
-    job_ids  = jobs["job_id"].to_numpy()
-    job_names = jobs["job_name"].to_numpy()
-
-    # For each vehicle, compute distance to all jobs and pick min
-    nearest_job_id = []
-    nearest_job_name = []
-    nearest_dist_mi = []
-
-    for _, row in v.iterrows():
-        dists = haversine_miles(row["latitude"], row["longitude"], job_lats, job_lons)
-        idx = int(np.argmin(dists))
-        nearest_job_id.append(job_ids[idx])
-        nearest_job_name.append(job_names[idx])
-        nearest_dist_mi.append(float(dists[idx]))
-
-    v["nearest_job_id"] = nearest_job_id
-    v["nearest_job_name"] = nearest_job_name
-    v["nearest_distance_mi"] = np.round(nearest_dist_mi, 3)
-    v["assigned_bucket"] = np.where(v["nearest_distance_mi"] <= threshold_miles,
-                                    v["nearest_job_name"], "Other")
+    v = nearest_jobs(vehicles_latest, jobs)
+    v["assigned_bucket"] = v["nearest_job_name"].where(
+        v["nearest_distance_mi"] <= threshold_miles, "Other")
     return v
 
-def load_data():
-    jobs = pd.read_csv(JOBS_CSV, dtype={"job_id": "string"})
-    vehicles = pd.read_csv(VEHICLE_CSV)
+def _read_csv(path, **kwargs):
+    """
+    pd.read_csv with the pyarrow engine, or the default C engine if pyarrow
+    is missing. dtype overrides always use the C engine: pyarrow infers the
+    column type before casting, so a "string" job_id like 0123 would come
+    back as "123".
+    """
+    if "dtype" in kwargs:
+        return pd.read_csv(path, **kwargs)
+    try:
+        return pd.read_csv(path, engine="pyarrow", **kwargs)
+    except ImportError:
+        return pd.read_csv(path, **kwargs)
+
+def _latest_vehicles_arrow(path):
+    """
+    Latest ping per vehicleId computed in Arrow: the CSV is scanned as a
+    dataset, max(timestamp) is a single hashed group_by, and the winning
+    rows are recovered with a join, so only the reduced frame reaches pandas.
+    Returns None when that isn't possible (pyarrow missing, key columns
+    absent, timestamps not parsed as timestamps) and pandas should be used.
+    """
+    if pads is None:
+        return None
+    try:
+        tbl = pads.dataset(path, format="csv").to_table()
+    except pa.ArrowInvalid:
+        return None
+    if (not set(LATEST_KEY_COLS) <= set(tbl.column_names)
+            or not pa.types.is_timestamp(tbl.schema.field("timestamp").type)):
+        return None
+
+    # Drop rows without a vehicle, coordinates or timestamp
+    valid = pc.is_valid(tbl["vehicleId"])
+    for col in ("timestamp", "latitude", "longitude"):
+        valid = pc.and_(valid, pc.is_valid(tbl[col]))
+    tbl = tbl.filter(valid)
+    tbl = tbl.append_column("_row", pa.array(np.arange(tbl.num_rows)))
+
+    latest = (tbl.group_by("vehicleId")
+                 .aggregate([("timestamp", "max"), ("_row", "min")])
+                 .rename_columns(["vehicleId", "timestamp", "_first_row"]))
+    df = tbl.join(latest, keys=["vehicleId", "timestamp"]).to_pandas()
+
+    # Same result as the pandas path: first max-timestamp row per vehicle,
+    # vehicles in order of first appearance
+    df = (df.sort_values(["_first_row", "_row"])
+            .drop_duplicates("vehicleId")
+            .drop(columns=["_row", "_first_row"]))
+    return df[tbl.column_names[:-1]].reset_index(drop=True)
+
+def read_latest_vehicles(path):
+    """
+    Read data.csv reduced to the latest ping per vehicle, in Arrow when
+    possible. A file missing the key columns is returned as-is so the
+    column validation below can report it.
+    """
+    latest = _latest_vehicles_arrow(path)
+    if latest is not None:
+        return latest
+    df = _read_csv(path)
+    if set(LATEST_KEY_COLS) <= set(df.columns):
+        df = latest_vehicle_positions(df)
+    return df
+
+@st.cache_data(show_spinner=False, ttl=300)
+def load_data(vehicle_path, jobs_path, vehicle_mtime, jobs_mtime):
+    """
+    Read jobs.csv and the latest ping per vehicle from data.csv. The mtimes
+    are only part of the cache key, so overwriting data.csv (e.g. from the
+    Samsara fetcher) invalidates the cached frames.
+    """
+    jobs = _read_csv(jobs_path, dtype={"job_id": "string"})
+    vehicles = read_latest_vehicles(vehicle_path)
+    # Low-cardinality keys: categoricals group and compare on int codes
+    jobs["job_id"] = jobs["job_id"].astype("category")
+    if "vehicleId" in vehicles.columns:  # else reported by the validation below
+        vehicles["vehicleId"] = vehicles["vehicleId"].astype("category")
     return jobs, vehicles
 
 # ---------- UI ----------
@@ -98,7 +260,8 @@ with st.sidebar:
 
 # Load data
 try:
-    jobs, vehicles = load_data()
+    jobs, vehicles_latest = load_data(VEHICLE_CSV, JOBS_CSV,
+                               os.path.getmtime(VEHICLE_CSV), os.path.getmtime(JOBS_CSV))
 except FileNotFoundError as e:
     st.error(f"Missing file: {e}")
     st.stop()
@@ -108,7 +271,7 @@ except Exception as e:
 
 # Basic validation
 required_vehicle_cols = {"vehicleId", "vehicleName", "timestamp", "latitude", "longitude"}
-missing_vehicle = required_vehicle_cols - set(vehicles.columns)
+missing_vehicle = required_vehicle_cols - set(vehicles_latest.columns)
 if missing_vehicle:
     st.error(f"`data.csv` missing required columns: {missing_vehicle}")
     st.stop()
@@ -119,14 +282,12 @@ if missing_jobs:
     st.error(f"`jobs.csv` missing required columns: {missing_jobs}")
     st.stop()
 
-# Keep only latest ping per vehicle
-vehicles_latest = latest_vehicle_positions(vehicles)
-
 # Assign
 assigned = assign_to_jobs(vehicles_latest, jobs, threshold_miles)
 
 # Summary
-counts = assigned["assigned_bucket"].value_counts().rename_axis("Job").reset_index(name="# Vehicles")
+counts = assigned["assigned_bucket"].value_counts()
+counts = counts[counts > 0].rename_axis("Job").reset_index(name="# Vehicles")  # drop unused categories
 left, right = st.columns([1,2])
 with left:
     st.subheader("Summary")
@@ -163,7 +324,7 @@ if not assigned.empty and not jobs.empty:
     center_lon = all_lons.mean()
 
     # ---- Jobs (records + 'job' field) ----
-    jobs_plot = jobs.rename(columns={"latitude": "lat", "longitude": "lon"}).copy()
+    jobs_plot = jobs.rename(columns={"latitude": "lat", "longitude": "lon"})
     jobs_plot["job"] = jobs_plot["job_name"].astype(str)
     job_records = jobs_plot.to_dict(orient="records")
 
@@ -180,17 +341,31 @@ if not assigned.empty and not jobs.empty:
     )
 
     # ---- Vehicles (records + 'vehicle' field + color) ----
-    veh_plot = assigned.rename(columns={"latitude":"lat","longitude":"lon"}).copy()
+    veh_plot = assigned.rename(columns={"latitude":"lat","longitude":"lon"})
     NAME_COL = "vehicleName" if "vehicleName" in veh_plot.columns else "vehicleId"
     veh_plot["vehicle"] = veh_plot[NAME_COL].fillna("").astype(str)
 
-    cond = veh_plot["assigned_bucket"].eq("Other").to_numpy()
-    colors = np.where(
-        cond[:, None],
-        np.array([220, 53, 69, 200], dtype=np.int32),
-        np.array([40, 167, 69, 200], dtype=np.int32)
-    )
-    veh_plot["color"] = colors.tolist()
+    # Row 0 = assigned (green), row 1 = Other (red); gather by bucket flag
+    palette = np.array([[40, 167, 69, 200], [220, 53, 69, 200]], dtype=np.uint8)
+    cond = veh_plot["assigned_bucket"].eq("Other").to_numpy(dtype=np.uint8)
+    veh_plot["color"] = palette[cond].tolist()  # pydeck needs plain JSON lists
+
+    # Only ship what the layers and tooltip use to the browser
+    veh_plot = veh_plot[["lat", "lon", "vehicle", "assigned_bucket",
+                         "nearest_job_name", "nearest_distance_mi", "color"]]
+
+    # Large fleets: bin the Other vehicles instead of drawing a point each
+    other_layer = None
+    if len(veh_plot) > MAP_AGGREGATE_OVER:
+        is_other = cond.astype(bool)
+        other_layer = pdk.Layer(
+            "HexagonLayer",
+            data=veh_plot.loc[is_other, ["lat", "lon"]].to_dict(orient="records"),
+            get_position="[lon, lat]",
+            radius=500,
+            elevation_scale=4,
+        )
+        veh_plot = veh_plot[~is_other]
 
     veh_records = veh_plot.replace({np.nan: None}).to_dict(orient="records")
 
@@ -220,7 +395,8 @@ if not assigned.empty and not jobs.empty:
     st.pydeck_chart(pdk.Deck(
         map_style="mapbox://styles/mapbox/satellite-streets-v12",
         initial_view_state=pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=9),
-        layers=[job_layer, veh_layer],
+        # Binned "Other" layer first so it draws beneath the pickable points
+        layers=([other_layer] if other_layer is not None else []) + [job_layer, veh_layer],
         tooltip=tooltip,  # dict is valid per docs
     ))
 else:
@@ -236,21 +412,21 @@ NAME_COL = "vehicleName" if "vehicleName" in assigned.columns else "vehicleId"
 # Split assigned into non-Other and Other
 assigned_non_other = assigned[assigned["assigned_bucket"] != "Other"].copy()
 assigned_non_other["nearest_job_id"] = assigned_non_other["nearest_job_id"].astype("string")
+assigned_non_other["vehicle"] = assigned_non_other[NAME_COL].astype(str)
 
-# Build a dict of vehicle subsets per job_id (fast lookups)
-by_job = {
-    jid: assigned_non_other[assigned_non_other["nearest_job_id"] == jid].copy()
-    for jid in jobs_sorted["job_id"]
-}
+# Build a dict of vehicle subsets per job_id in one groupby pass;
+# jobs with no vehicles get an empty frame
+groups = dict(tuple(assigned_non_other.groupby("nearest_job_id", sort=False)))
+empty = assigned_non_other.iloc[0:0]
+by_job = {jid: groups.get(jid, empty) for jid in jobs_sorted["job_id"]}
 
-# Group 1: projects with vehicles (sorted by job_id)
+# Group 1: projects with vehicles (jobs_sorted is already sorted by job_id);
+# one entry per job_id, named after its first row
 with_vehicles = [
-    (jid,
-     jobs_sorted.loc[jobs_sorted["job_id"] == jid, "job_name"].iloc[0],
-     df)
-    for jid, df in by_job.items() if len(df) > 0
+    (row.job_id, row.job_name, by_job[row.job_id])
+    for row in jobs_sorted.drop_duplicates("job_id").itertuples(index=False)
+    if len(by_job[row.job_id]) > 0
 ]
-with_vehicles.sort(key=lambda x: x[0])  # sort by job_id
 
 # Group 3: projects with zero vehicles (keep jobs_sorted order)
 zero_vehicles = [
@@ -264,7 +440,6 @@ zero_vehicles = [
 if with_vehicles:
     st.markdown("### Projects with vehicles")
     for jid, jname, df in with_vehicles:
-        df["vehicle"] = df[NAME_COL].astype(str)
         with st.expander(f"{jid} — {jname}  •  {len(df)} vehicle(s)"):
             st.dataframe(
                 df[["vehicle", "nearest_distance_mi"]]
@@ -1,13 +1,24 @@
 # cat_client.py
 import os
+import time
 import requests
-import uuid
 import json
 import base64
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # optional: faster parsing of large fleet pages
+except ImportError:
+    orjson = None
+
 CAT_TOKEN_URL = (
     "https://login.microsoftonline.com/ceb177bf-013b-49ab-8a9c-4abce32afc1e/oauth2/v2.0/token"
 )
@@ -18,6 +29,32 @@ CAT_CLIENT_SECRET = os.getenv("CAT_CLIENT_SECRET")  # ✅
 CAT_BASE_URL = "https://api.cat.com"
 CAT_FLEET_PATH = "/telematics/iso15143/fleet/{pageNumber}"
 
+# Shared session so pages reuse kept-alive TLS connections instead of
+# handshaking per request. Final failed responses are returned (not raised)
+# so the callers below can surface them as CatAuthError / CatApiError.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Tracking IDs: a random per-process prefix plus a counter is unique enough
+# for CAT's request tracing without an entropy read per request
+_TRACKING_PREFIX = os.urandom(8).hex()
+_tracking_counter = itertools.count()
+
+# Cached bearer token: (access_token, monotonic expiry time)
+_token_cache: Optional[Tuple[str, float]] = None
+_TOKEN_EXPIRY_MARGIN_S = 60
+
 class CatAuthError(Exception):
     pass
 
@@ -32,11 +69,14 @@ def _build_basic_auth_header(client_id: str, client_secret: str) -> str:
     encoded = base64.b64encode(creds).decode("utf-8")
     return f"Basic {encoded}"
 
-def get_cat_access_token() -> str:
+def get_cat_access_token(force_refresh: bool = False) -> str:
     """
     Fetch an OAuth2 access token from CAT's Entra ID token endpoint
     using the Client Credentials grant.
 
+    The token is cached in-process until shortly before it expires, so
+    paginated fetches don't do an OAuth round-trip per page.
+
     Uses:
       - CAT_CLIENT_ID
       - CAT_CLIENT_SECRET
@@ -44,6 +84,12 @@ def get_cat_access_token() -> str:
     Returns:
       A bearer token string.
     """
+    global _token_cache
+    if not force_refresh and _token_cache is not None:
+        token, expires_at = _token_cache
+        if time.monotonic() < expires_at:
+            return token
+
     if not CAT_CLIENT_ID or not CAT_CLIENT_SECRET:
         raise CatAuthError(
             "CAT_CLIENT_ID and/or CAT_CLIENT_SECRET are not set in environment variables."
@@ -60,7 +106,7 @@ def get_cat_access_token() -> str:
         "scope": f"{CAT_CLIENT_ID}/.default",
     }
 
-    resp = requests.post(CAT_TOKEN_URL, headers=headers, data=data, timeout=30)
+    resp = _SESSION.post(CAT_TOKEN_URL, headers=headers, data=data, timeout=30)
     if not resp.ok:
         raise CatAuthError(
             f"Failed to obtain CAT access token: {resp.status_code} {resp.text}"
@@ -73,23 +119,45 @@ def get_cat_access_token() -> str:
             f"CAT token response missing 'access_token': {token_data}"
         )
 
+    try:
+        expires_in = float(token_data.get("expires_in", 0))
+    except (TypeError, ValueError):
+        expires_in = 0.0
+    _token_cache = (
+        access_token,
+        time.monotonic() + max(expires_in - _TOKEN_EXPIRY_MARGIN_S, 0.0),
+    )
+
     return access_token
 
 
-def fetch_cat_raw_fleet_page(page_number: int = 1) -> Any:
+def _base_headers() -> Dict[str, str]:
+    """Auth + Accept headers shared by every fleet page request."""
+    return {
+        "Authorization": f"Bearer {get_cat_access_token()}",
+        "Accept": "application/json",
+    }
+
+
+def fetch_cat_raw_fleet_page(
+    page_number: int = 1, base_headers: Optional[Dict[str, str]] = None
+) -> Any:
     """
     Call a single page of the CAT ISO 15143 fleet endpoint and return raw JSON.
 
     Corresponds to the sample:
       GET https://api.cat.com/telematics/iso15143/fleet/{pageNumber}
+
+    Multi-page callers can build `base_headers` once with _base_headers();
+    otherwise they are built here.
     """
-    token = get_cat_access_token()
+    if base_headers is None:
+        base_headers = _base_headers()
 
     headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
-        # Tracking ID can be anything unique; use a UUID so each request is traceable
-        "X-Cat-API-Tracking-Id": str(uuid.uuid4()),
+        **base_headers,
+        # Tracking ID can be anything unique so each request is traceable
+        "X-Cat-API-Tracking-Id": f"{_TRACKING_PREFIX}-{next(_tracking_counter):x}",
     }
 
     url = f"{CAT_BASE_URL}{CAT_FLEET_PATH.format(pageNumber=page_number)}"
@@ -97,14 +165,14 @@ def fetch_cat_raw_fleet_page(page_number: int = 1) -> Any:
     # Their snippet had an empty params dict; we mirror that for now.
     params: Dict[str, Any] = {}
 
-    resp = requests.get(url, headers=headers, params=params, timeout=30)
+    resp = _SESSION.get(url, headers=headers, params=params, timeout=30)
     if not resp.ok:
         raise CatApiError(
             f"Failed to fetch CAT fleet page {page_number}: "
             f"{resp.status_code} {resp.text}"
         )
 
-    return resp.json()
+    return orjson.loads(resp.content) if orjson is not None else resp.json()
 
 
 def _extract_items_from_fleet_json(data: Any) -> List[Dict[str, Any]]:
@@ -134,7 +202,10 @@ def _extract_items_from_fleet_json(data: Any) -> List[Dict[str, Any]]:
 
 
 
-def normalize_cat_position(raw: Dict[str, Any]) -> Dict[str, Any]:
+_EMPTY: Dict[str, Any] = {}
+
+
+def normalize_cat_position(raw: Dict[str, Any], keep_raw: bool = False) -> Dict[str, Any]:
     """
     Map one CAT 'Equipment' record to the common vehicle_positions dict shape:
       {
@@ -150,10 +221,13 @@ def normalize_cat_position(raw: Dict[str, Any]) -> Dict[str, Any]:
           "timestamp_utc": ts,
           "raw": raw,
       }
+
+    "raw" is None unless keep_raw is set, so callers that don't persist the
+    source payload don't keep whole fleet pages alive.
     """
-    header = raw.get("EquipmentHeader", {}) or {}
-    loc = raw.get("Location", {}) or {}
-    dist = raw.get("Distance", {}) or {}
+    header = raw.get("EquipmentHeader") or _EMPTY
+    loc = raw.get("Location") or _EMPTY
+    dist = raw.get("Distance") or _EMPTY
 
     # IDs / identity
     equipment_id = header.get("EquipmentID")
@@ -205,14 +279,13 @@ def normalize_cat_position(raw: Dict[str, Any]) -> Dict[str, Any]:
         "speed_kph": speed,
         "odometer_km": odometer_km,
         "timestamp_utc": ts,
-        "raw": raw,
+        "raw": raw if keep_raw else None,
     }
 
-from urllib.parse import urlparse
-
-def _get_next_page_number(data: Any) -> Optional[int]:
+def _get_link_page_number(data: Any, rel_name: str) -> Optional[int]:
     """
-    Look at the 'Links' array and return the next page number if a 'Next' link exists.
+    Look at the 'Links' array and return the page number of the link whose
+    'Rel' matches `rel_name` (case-insensitive), if present.
     Example link:
       { "Rel": "Next", "Href": "https://api.cat.com/telematics/iso15143/fleet/5" }
     """
@@ -226,7 +299,7 @@ def _get_next_page_number(data: Any) -> Optional[int]:
     for link in links:
         rel = str(link.get("Rel", "")).lower()
         href = link.get("Href")
-        if rel == "next" and isinstance(href, str):
+        if rel == rel_name and isinstance(href, str):
             # URL ends with /fleet/{pageNumber}
             try:
                 path = urlparse(href).path  # /telematics/iso15143/fleet/5
@@ -238,30 +311,58 @@ def _get_next_page_number(data: Any) -> Optional[int]:
     return None
 
 
+def _get_next_page_number(data: Any) -> Optional[int]:
+    """Return the page number of the 'Next' link, if any."""
+    return _get_link_page_number(data, "next")
+
+
+def _get_last_page_number(data: Any) -> Optional[int]:
+    """Return the page number of the 'Last' link, if any."""
+    return _get_link_page_number(data, "last")
 
 
-def fetch_cat_positions(start_page: int = 1, max_pages: int = 50) -> List[Dict[str, Any]]:
+def fetch_cat_positions(
+    start_page: int = 1, max_pages: int = 50, keep_raw: bool = False
+) -> List[Dict[str, Any]]:
     """
     Public entry point used by vehicles_to_supabase_sync.py.
 
-    Walks pages starting from `start_page`, following 'Next' links until there
-    are no more or we hit max_pages. Returns a list of normalized dicts.
+    Fetches `start_page` first. If its 'Links' include a 'Last' page, the
+    remaining pages (capped at max_pages in total) are fetched concurrently.
+    Otherwise walks pages following 'Next' links until there are no more or
+    we hit max_pages. Returns a list of normalized dicts; pass keep_raw=True
+    to keep each source record under "raw".
     """
+    # Auth headers are built once for the whole fetch, not per page
+    fetch_page = partial(fetch_cat_raw_fleet_page, base_headers=_base_headers())
+    first_page = fetch_page(start_page)
+
+    last_page = _get_last_page_number(first_page)
+    if last_page is not None:
+        last_page = min(last_page, start_page + max_pages - 1)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            rest = list(executor.map(fetch_page,
+                                     range(start_page + 1, last_page + 1)))
+        return [
+            normalize_cat_position(item, keep_raw=keep_raw)
+            for page in [first_page, *rest]
+            for item in _extract_items_from_fleet_json(page)
+        ]
+
+    # No 'Last' link: fall back to walking 'Next' links serially
     all_items: List[Dict[str, Any]] = []
-    current_page = start_page
+    raw_data = first_page
 
     for _ in range(max_pages):
         print(f"Page number {_}")
-        raw_data = fetch_cat_raw_fleet_page(page_number=current_page)
-        items = _extract_items_from_fleet_json(raw_data)
-        all_items.extend(normalize_cat_position(item) for item in items)
+        all_items.extend(_extract_items_from_fleet_json(raw_data))
 
         next_page = _get_next_page_number(raw_data)
-        if not next_page:
+        if not next_page or _ == max_pages - 1:
             break
-        current_page = next_page
+        raw_data = fetch_page(next_page)
 
-    return all_items
+    return [normalize_cat_position(item, keep_raw=keep_raw) for item in all_items]
 
 def test_cat_api_connectivity():
     """
@@ -298,7 +399,7 @@ def test_cat_api_connectivity():
     # 2) Now run the full paginated fetch
     print("Requesting full CAT fleet (all pages via fetch_cat_positions)...")
     try:
-        vehicles = fetch_cat_positions()
+        vehicles = fetch_cat_positions(keep_raw=True)
     except Exception as e:
         print("❌ CAT API call failed during paginated fetch:")
         print(e)
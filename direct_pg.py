@@ -0,0 +1,112 @@
+"""
+Direct Postgres connection to the ForeSyt database, for bulk writes that are
+cheaper as SQL than through the Supabase REST API.
+
+Optional: only used when SUPABASE_DB_URL is set to a postgres:// connection
+string (direct connection or the session pooler on port 5432). psycopg2
+interpolates parameters client-side and never creates server-side prepared
+statements, so it also works behind Supabase's transaction pooler, where
+prepared statements fail with "prepared statement ... does not exist".
+"""
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+# Load .env file if present (for local development)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass  # python-dotenv not installed, rely on system env vars
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from supabase_db import BULK_CHUNK_SIZE, ensure_datetime_utc
+
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
+
+
+def is_configured() -> bool:
+    """True if SUPABASE_DB_URL is set, i.e. the direct path can be used."""
+    return bool(SUPABASE_DB_URL)
+
+
+@contextmanager
+def connect() -> Iterator["psycopg2.extensions.connection"]:
+    """
+    Open a connection for one unit of work, committing on success and
+    rolling back on error.
+
+    Connections are not pooled: the sync runs once per invocation, and a
+    held-open connection would only tie up a pooler slot between runs.
+    """
+    if not SUPABASE_DB_URL:
+        raise ValueError("SUPABASE_DB_URL must be set in environment")
+
+    conn = psycopg2.connect(SUPABASE_DB_URL, connect_timeout=10)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+_POSITION_COLUMNS = (
+    "organization_id",
+    "vehicle_id",
+    "latitude",
+    "longitude",
+    "heading",
+    "speed_kph",
+    "odometer_km",
+    "timestamp_utc",
+    "source_raw",
+)
+
+_UPSERT_POSITIONS_SQL = (
+    f"INSERT INTO vehicle_positions ({', '.join(_POSITION_COLUMNS)}) VALUES %s "
+    "ON CONFLICT (vehicle_id) DO UPDATE SET "
+    + ", ".join(f"{c} = EXCLUDED.{c}" for c in _POSITION_COLUMNS if c != "vehicle_id")
+)
+
+
+def insert_positions_bulk(
+    organization_id: str,
+    rows: List[Dict[str, Any]],
+) -> int:
+    """
+    SQL version of supabase_db.insert_positions_bulk, with the same rows and
+    result: multi-row INSERT ... ON CONFLICT (vehicle_id) DO UPDATE
+    statements of BULK_CHUNK_SIZE rows, in one transaction.
+
+    Returns the number of positions written.
+    """
+    if not rows:
+        return 0
+
+    # Last row per vehicle wins; a statement can't update the same row twice
+    by_vehicle: Dict[str, tuple] = {}
+    for row in rows:
+        source_raw = row.get("source_raw")
+        by_vehicle[row["vehicle_id"]] = (
+            organization_id,
+            row["vehicle_id"],
+            row["latitude"],
+            row["longitude"],
+            row.get("heading"),
+            row.get("speed_kph"),
+            row.get("odometer_km"),
+            ensure_datetime_utc(row["timestamp_utc"]),
+            Json(source_raw) if source_raw is not None else None,
+        )
+
+    with connect() as conn, conn.cursor() as cur:
+        execute_values(
+            cur,
+            _UPSERT_POSITIONS_SQL,
+            list(by_vehicle.values()),
+            page_size=BULK_CHUNK_SIZE,
+        )
+
+    return len(by_vehicle)
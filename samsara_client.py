@@ -1,43 +1,80 @@
 import os
-import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # optional: faster parsing of large location pages
+except ImportError:
+    orjson = None
 
 SAMSARA_BASE_URL = "https://api.samsara.com"
 SAMSARA_API_TOKEN = os.getenv("SAMSARA_API_TOKEN")
 
+# Retry policy for the shared session. Rate limiting is handled here: 429s
+# are retried after the Retry-After delay Samsara sends (seconds or HTTP-date),
+# other 429/5xx responses back off exponentially, so pages aren't throttled
+# up front. Final failed responses are returned (not raised) so
+# _fetch_paginated can report them as SamsaraError.
+_RETRY_KWARGS: Dict[str, Any] = dict(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    raise_on_status=False,
+)
+try:
+    # urllib3 2.x: cap each wait and add jitter so the concurrent location
+    # streams don't retry in lockstep
+    _RETRY = Retry(**_RETRY_KWARGS, backoff_max=30, backoff_jitter=0.5)
+except TypeError:
+    _RETRY = Retry(**_RETRY_KWARGS)
+
+# Shared session so paginated calls reuse kept-alive TLS connections.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=20, max_retries=_RETRY))
+
 
 class SamsaraError(Exception):
     """Custom exception for Samsara API errors."""
     pass
 
 
+# Auth headers, built once: the token is only read from the env at import
+_HEADERS: Optional[Dict[str, str]] = (
+    {
+        "Authorization": f"Bearer {SAMSARA_API_TOKEN}",
+        "Accept": "application/json",
+    }
+    if SAMSARA_API_TOKEN
+    else None
+)
+
+
 def _get_headers() -> Dict[str, str]:
     """
-    Build auth headers for Samsara API.
+    Return auth headers for Samsara API.
     Requires SAMSARA_API_TOKEN to be set in the environment.
     """
-    if not SAMSARA_API_TOKEN:
+    if _HEADERS is None:
         raise SamsaraError("SAMSARA_API_TOKEN env var is not set")
-    return {
-        "Authorization": f"Bearer {SAMSARA_API_TOKEN}",
-        "Accept": "application/json",
-    }
+    return _HEADERS
 
 
 # ---------------------------------------------------------------------------
 # Generic pagination helpers
 # ---------------------------------------------------------------------------
 
-def _fetch_paginated(
+def _iter_paginated(
     path: str,
     data_key: str,
     params: Optional[Dict[str, Any]] = None,
     limit: int = 200,
-) -> List[Dict[str, Any]]:
+) -> Iterator[Dict[str, Any]]:
     """
-    Generic helper to fetch all pages from a Samsara endpoint that uses:
+    Generic helper to walk all pages from a Samsara endpoint that uses:
       {
         "<data_key>": [...],
         "pagination": {
@@ -49,6 +86,9 @@ def _fetch_paginated(
 
     Most v2 endpoints use `data_key="data"`.
     The v1 assets endpoint uses `data_key="assets"`.
+
+    Items are yielded page by page, so only the current page is held here
+    and consumers can start work before the last page arrives.
     """
     if params is None:
         params = {}
@@ -60,27 +100,29 @@ def _fetch_paginated(
     params = dict(params)  # shallow copy so we don't mutate caller's dict
     params.setdefault("limit", limit)
 
-    all_items: List[Dict[str, Any]] = []
     next_cursor: Optional[str] = None
 
     while True:
         if next_cursor:
             params["after"] = next_cursor
 
-        resp = requests.get(url, headers=headers, params=params, timeout=30)
+        resp = _SESSION.get(url, headers=headers, params=params, timeout=30)
         if resp.status_code != 200:
             raise SamsaraError(
                 f"Samsara API error {resp.status_code} for {path}: {resp.text[:500]}"
             )
 
-        payload = resp.json()
+        try:
+            payload = orjson.loads(resp.content) if orjson is not None else resp.json()
+        except ValueError as e:  # orjson.JSONDecodeError / requests' JSONDecodeError
+            raise SamsaraError(f"Invalid JSON from Samsara for {path}: {e}") from e
         items = payload.get(data_key, [])
         if not isinstance(items, list):
             raise SamsaraError(
                 f"Unexpected payload format for {path}: {data_key} is not a list"
             )
 
-        all_items.extend(items)
+        yield from items
 
         pagination = payload.get("pagination") or {}
         next_cursor = pagination.get("after") or pagination.get("endCursor")
@@ -89,10 +131,15 @@ def _fetch_paginated(
         if not next_cursor or not has_next:
             break
 
-        # Be gentle on their API (docs mention polling limits)
-        time.sleep(0.2)
 
-    return all_items
+def _fetch_paginated(
+    path: str,
+    data_key: str,
+    params: Optional[Dict[str, Any]] = None,
+    limit: int = 200,
+) -> List[Dict[str, Any]]:
+    """Materialize _iter_paginated into a list (all pages merged)."""
+    return list(_iter_paginated(path, data_key, params=params, limit=limit))
 
 
 # ---------------------------------------------------------------------------
@@ -251,15 +298,17 @@ def fetch_all_location_payloads() -> Dict[str, List[Dict[str, Any]]]:
       - equipment locations (v2)
       - v1 assets locations (legacy shape)
 
+    The three endpoints are independent, so they are fetched concurrently
+    (each one still walks its own pages in order).
+
     Returns a dict so you can decide how to normalize/merge them in your
     samsara_to_supabase_sync.py without coupling that logic to this client.
     """
-    vehicles = fetch_vehicle_locations()
-    equipment = fetch_equipment_locations()
-    assets_v1 = fetch_assets_locations_v1()
-
-    return {
-        "vehicles": vehicles,
-        "equipment": equipment,
-        "assets_v1": assets_v1,
+    fetchers = {
+        "vehicles": fetch_vehicle_locations,
+        "equipment": fetch_equipment_locations,
+        "assets_v1": fetch_assets_locations_v1,
     }
+    with ThreadPoolExecutor(max_workers=len(fetchers)) as executor:
+        futures = {key: executor.submit(fn) for key, fn in fetchers.items()}
+        return {key: future.result() for key, future in futures.items()}
@@ -1,7 +1,14 @@
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 
 
-from typing import Any, Dict, List
+# Lower rank = higher priority.
+# We prefer vehicles_v2 over equipment_v2 over assets_v1.
+_CATEGORY_RANK = {
+    "vehicles_v2": 0,
+    "equipment_v2": 1,
+    "assets_v1": 2,
+}
+_UNRANKED = 99
 
 
 def _category_rank(cat: str) -> int:
@@ -9,12 +16,7 @@ def _category_rank(cat: str) -> int:
     Lower rank = higher priority.
     We prefer vehicles_v2 over equipment_v2 over assets_v1.
     """
-    order = {
-        "vehicles_v2": 0,
-        "equipment_v2": 1,
-        "assets_v1": 2,
-    }
-    return order.get(cat, 99)
+    return _CATEGORY_RANK.get(cat, _UNRANKED)
 
 
 def dedupe_normalized_locations(
@@ -31,9 +33,12 @@ def dedupe_normalized_locations(
           - Else fall back to name+lat+lon (very rare / weird cases)
 
     If multiple records share the same key, we keep the one with the
-    highest-priority source_category (vehicles_v2 > equipment_v2 > assets_v1).
+    highest-priority source_category (vehicles_v2 > equipment_v2 > assets_v1),
+    using the "_rank" stamped by normalize_location_record (records without
+    one, e.g. CAT, rank last).
     """
-    by_key: Dict[str, Dict[str, Any]] = {}
+    # Tuple keys hash without formatting a string per record
+    by_key: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
 
     for rec in records:
         name_raw = (rec.get("name") or "").strip()
@@ -43,27 +48,24 @@ def dedupe_normalized_locations(
 
         if name_raw:
             # ✅ Primary key: name only, normalized
-            key = f"name:{name_raw.lower()}"
+            key = ("name", name_raw.lower())
         elif ext_id:
             # Fallback: if somehow we have no name but do have an ID
-            key = f"id-fallback:{ext_id}"
+            key = ("id-fallback", ext_id)
         else:
             # Last-resort fallback: name + lat + lon (for very weird cases)
             if lat is None or lon is None:
-                key = f"unnamed:{id(rec)}"  # effectively no dedupe, unique per record
+                key = ("unnamed", id(rec))  # effectively no dedupe, unique per record
             else:
-                key = f"latlon:{round(float(lat), 5)}|{round(float(lon), 5)}"
+                key = ("latlon", round(float(lat), 5), round(float(lon), 5))
 
         existing = by_key.get(key)
         if not existing:
             by_key[key] = rec
         else:
             # Decide which one to keep based on category priority
-            old_rank = _category_rank(existing.get("source_category", ""))
-            new_rank = _category_rank(rec.get("source_category", ""))
-
             # Lower rank value = higher priority (per your existing logic)
-            if new_rank < old_rank:
+            if rec.get("_rank", _UNRANKED) < existing.get("_rank", _UNRANKED):
                 by_key[key] = rec
 
     return list(by_key.values())
@@ -212,6 +214,7 @@ def normalize_location_record(
         "external_id": external_id,
         "source_system": "samsara",
         "source_category": category,
+        "_rank": _category_rank(category),  # precomputed for dedupe
         "name": name,
         "vehicle_type": vtype,
         "latitude": lat,
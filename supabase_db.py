@@ -1,6 +1,10 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Iterator, List, Tuple, TypeVar
+
+import httpx
 
 # Load .env file if present (for local development)
 try:
@@ -9,75 +13,191 @@ try:
 except ImportError:
     pass  # python-dotenv not installed, rely on system env vars
 
-from supabase import create_client, Client
+try:
+    from ciso8601 import parse_datetime as _fast_parse_iso  # optional: faster ISO 8601 parsing
+except ImportError:
+    _fast_parse_iso = None
+
+from supabase import create_client, Client, ClientOptions
+from postgrest import ReturnMethod
 
 # ForeSyt Supabase connection via REST API
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-# Lazy-initialized client
+T = TypeVar("T")
+
+# Max rows per bulk REST request (keeps bodies and in_() URLs bounded)
+BULK_CHUNK_SIZE = 500
+# Max chunks of one bulk call in flight at once
+BULK_MAX_WORKERS = 4
+
+# Connection pool for the REST client; sized above BULK_MAX_WORKERS so
+# concurrent chunks never wait on a connection
+HTTP_MAX_CONNECTIONS = 20
+HTTP_TIMEOUT_SECONDS = 30
+
+# (organization_id, external_id, source_system) -> vehicle uuid. The mapping is
+# stable, so once known the bulk upsert doesn't need the rows sent back.
+# Cleared by the delete helpers, since a re-created vehicle gets a new id.
+_vehicle_id_cache: Dict[Tuple[str, str, str], str] = {}
+
+# Lazy-initialized client, shared process-wide so every call reuses its
+# pooled keep-alive HTTP connections instead of handshaking again
 _supabase_client: Optional[Client] = None
+_client_lock = threading.Lock()
 
 
 def get_client() -> Client:
-    """Get or create the Supabase client."""
+    """Get or create the Supabase client (safe to call from worker threads)."""
     global _supabase_client
     if _supabase_client is None:
-        if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-            raise ValueError(
-                "SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment"
-            )
-        _supabase_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        with _client_lock:
+            if _supabase_client is None:
+                if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+                    raise ValueError(
+                        "SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment"
+                    )
+                _supabase_client = _create_client()
     return _supabase_client
 
 
-def _ensure_datetime_utc(ts) -> datetime:
+def _http_client() -> httpx.Client:
+    """Pooled keep-alive httpx client, HTTP/2 when the h2 extra is installed."""
+    kwargs = dict(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+        timeout=HTTP_TIMEOUT_SECONDS,
+        follow_redirects=True,
+    )
+    try:
+        return httpx.Client(http2=True, **kwargs)
+    except ImportError:
+        return httpx.Client(**kwargs)  # httpx[http2] not installed
+
+
+def _create_client() -> Client:
+    try:
+        options = ClientOptions(httpx_client=_http_client())
+    except TypeError:
+        # supabase-py releases without httpx_client keep their default transport
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=options)
+
+
+def _chunks(items: List[Any], size: Optional[int] = None) -> Iterator[List[Any]]:
+    """Yield consecutive slices of `items` with at most `size` (default BULK_CHUNK_SIZE) elements."""
+    size = size or BULK_CHUNK_SIZE
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _map_chunks(fn: Callable[[List[Any]], T], chunks: List[List[Any]]) -> List[T]:
     """
-    Convert various timestamp formats into a timezone-aware datetime in UTC.
+    Apply `fn` to each chunk and return the results in order. Chunks are
+    independent requests, so more than one is sent concurrently (up to
+    BULK_MAX_WORKERS) over the shared client.
+    """
+    if len(chunks) <= 1:
+        return [fn(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(BULK_MAX_WORKERS, len(chunks))) as executor:
+        return list(executor.map(fn, chunks))
 
-    Handles:
-      - datetime (returns as-is, ensuring tzinfo=UTC if missing)
-      - int/float: Unix seconds or milliseconds since epoch
-      - str: ISO8601 like '2025-11-13T19:26:28Z' or with offset
+
+def invalidate_vehicle_cache(organization_id: Optional[str] = None) -> None:
+    """Forget cached vehicle ids, for one organization or (default) all."""
+    if organization_id is None:
+        _vehicle_id_cache.clear()
+        return
+    for key in [k for k in _vehicle_id_cache if k[0] == organization_id]:
+        del _vehicle_id_cache[key]
+
+
+def parse_iso(s: str) -> datetime:
+    """
+    Parse an ISO 8601 / RFC 3339 timestamp such as '2025-11-13T19:26:28Z'.
+
+    Uses ciso8601 when installed, else datetime.fromisoformat (with the
+    trailing Z rewritten for Pythons before 3.11). The result keeps the
+    string's offset, or is naive if it had none. Raises ValueError.
     """
-    # Already a datetime
-    if isinstance(ts, datetime):
-        if ts.tzinfo is None:
-            return ts.replace(tzinfo=timezone.utc)
-        return ts.astimezone(timezone.utc)
+    if _fast_parse_iso is not None:
+        try:
+            return _fast_parse_iso(s)
+        except ValueError:
+            pass
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    return datetime.fromisoformat(s)
+
+
+def _utc_from_datetime(ts: datetime) -> datetime:
+    # Naive datetimes are taken to be UTC already
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    if ts.tzinfo is timezone.utc:
+        return ts
+    return ts.astimezone(timezone.utc)
 
+
+def _utc_from_epoch(ts) -> datetime:
     # Numeric: treat as unix seconds or ms
-    if isinstance(ts, (int, float)):
-        value = float(ts)
-        # Heuristic: ms vs sec
-        if value > 1e12:
-            # milliseconds
-            value = value / 1000.0
-        return datetime.fromtimestamp(value, tz=timezone.utc)
+    value = float(ts)
+    # Heuristic: ms vs sec
+    if value > 1e12:
+        # milliseconds
+        value = value / 1000.0
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
 
+def _utc_from_str(ts: str) -> Optional[datetime]:
     # String: try ISO8601
-    if isinstance(ts, str):
-        s = ts.strip()
+    s = ts.strip()
+    try:
+        dt = parse_iso(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc)
+    except Exception:
+        # Last resort: try interpreting as float seconds
         try:
-            # Handle trailing Z
-            if s.endswith("Z"):
-                s = s[:-1] + "+00:00"
-            dt = datetime.fromisoformat(s)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt.astimezone(timezone.utc)
+            return _utc_from_epoch(s)
         except Exception:
-            # Last resort: try interpreting as float seconds
-            try:
-                value = float(s)
-                if value > 1e12:
-                    value = value / 1000.0
-                return datetime.fromtimestamp(value, tz=timezone.utc)
-            except Exception:
-                pass
+            return None
+
+
+# Exact-type dispatch for ensure_datetime_utc; subclasses (bool, pandas
+# Timestamp, ...) miss the lookup and go through the isinstance checks
+_UTC_CONVERTERS: Dict[type, Callable[[Any], Optional[datetime]]] = {
+    datetime: _utc_from_datetime,
+    int: _utc_from_epoch,
+    float: _utc_from_epoch,
+    str: _utc_from_str,
+}
+
+
+def ensure_datetime_utc(ts) -> datetime:
+    """
+    Convert various timestamp formats into a timezone-aware datetime in UTC.
+
+    Handles:
+      - datetime (returns as-is, ensuring tzinfo=UTC if missing)
+      - int/float: Unix seconds or milliseconds since epoch
+      - str: ISO8601 like '2025-11-13T19:26:28Z' or with offset
+    """
+    convert = _UTC_CONVERTERS.get(type(ts))
+    if convert is None:
+        for base in (datetime, int, float, str):
+            if isinstance(ts, base):
+                convert = _UTC_CONVERTERS[base]
+                break
+
+    dt = convert(ts) if convert is not None else None
 
     # Fallback: now()
-    return datetime.now(timezone.utc)
+    return dt if dt is not None else datetime.now(timezone.utc)
 
 
 def upsert_vehicle(
@@ -94,60 +214,121 @@ def upsert_vehicle(
 
     Returns None if the vehicle is soft-deleted (blocklisted), indicating
     it should be skipped during sync.
+
+    Single-record wrapper around upsert_vehicles_bulk, so one vehicle costs
+    the same fixed number of requests as a whole sync.
     """
-    client = get_client()
+    ids = upsert_vehicles_bulk(
+        organization_id,
+        [{
+            "external_id": external_id,
+            "source_system": source_system,
+            "name": name,
+            "vehicle_type": vtype,
+            "description": description,
+        }],
+    )
+    return ids.get((external_id, source_system))
 
-    # Check if vehicle already exists and is soft-deleted
-    existing = (
-        client.table("vehicles")
-        .select("id, is_deleted")
+
+def get_blocklisted_keys(organization_id: str) -> set[Tuple[str, str]]:
+    """
+    Return the (external_id, source_system) keys of the org's soft-deleted
+    (blocklisted) vehicles, in one query.
+
+    The whole blocklist is fetched rather than filtering by the incoming
+    external_ids: it is small, and an in_() over a full sync would not fit
+    in one request URL.
+    """
+    deleted = (
+        get_client()
+        .table("vehicles")
+        .select("external_id, source_system")
         .eq("organization_id", organization_id)
-        .eq("external_id", external_id)
-        .eq("source_system", source_system)
+        .eq("is_deleted", True)
         .execute()
     )
+    return {(v["external_id"], v["source_system"]) for v in deleted.data or []}
 
-    if existing.data and len(existing.data) > 0:
-        vehicle = existing.data[0]
-        if vehicle.get("is_deleted"):
-            # Vehicle is soft-deleted, skip syncing it
-            return None
 
-    now = datetime.now(timezone.utc).isoformat()
-    data = {
-        "organization_id": organization_id,
-        "external_id": external_id,
-        "source_system": source_system,
-        "name": name,
-        "type": vtype,
-        "description": description,
-        "updated_at": now,
-        "last_seen_at": now,  # Track when vehicle was last seen in sync
-    }
+def upsert_vehicles_bulk(
+    organization_id: str,
+    records: List[Dict[str, Any]],
+) -> Dict[Tuple[str, str], str]:
+    """
+    Bulk version of upsert_vehicle for a whole sync.
 
-    # Remove None values (let DB use defaults)
-    data = {k: v for k, v in data.items() if v is not None}
+    Each record is a dict with external_id, source_system and optionally
+    name, vehicle_type, description. Returns a dict mapping
+    (external_id, source_system) -> vehicle uuid. Soft-deleted (blocklisted)
+    vehicles are skipped and have no entry in the result.
 
-    result = (
-        client.table("vehicles")
-        .upsert(data, on_conflict="organization_id,external_id,source_system")
-        .execute()
-    )
+    Raises RuntimeError if an upsert that asked for the rows back returns
+    none (typically RLS hiding them), rather than re-querying.
+    """
+    if not records:
+        return {}
 
-    if result.data and len(result.data) > 0:
-        return str(result.data[0]["id"])
+    client = get_client()
+    blocklisted = get_blocklisted_keys(organization_id)
 
-    # If upsert didn't return data, query for the vehicle
-    query_result = (
-        client.table("vehicles")
-        .select("id")
-        .eq("organization_id", organization_id)
-        .eq("external_id", external_id)
-        .eq("source_system", source_system)
-        .single()
-        .execute()
-    )
-    return str(query_result.data["id"])
+    now = datetime.now(timezone.utc).isoformat()
+    rows_by_key: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for rec in records:
+        key = (rec["external_id"], rec["source_system"])
+        if key in blocklisted:
+            continue
+        data = {
+            "organization_id": organization_id,
+            "external_id": rec["external_id"],
+            "source_system": rec["source_system"],
+            "name": rec.get("name"),
+            "type": rec.get("vehicle_type"),
+            "description": rec.get("description"),
+            "updated_at": now,
+            "last_seen_at": now,  # Track when vehicle was last seen in sync
+        }
+        # Remove None values (let DB use defaults); later records win
+        rows_by_key[key] = {k: v for k, v in data.items() if v is not None}
+
+    # A bulk upsert updates every column it sends, so rows are grouped by the
+    # columns they carry; a missing type/description keeps the stored value
+    batches: Dict[frozenset, List[Dict[str, Any]]] = {}
+    for row in rows_by_key.values():
+        batches.setdefault(frozenset(row), []).append(row)
+
+    def upsert_chunk(chunk: List[Dict[str, Any]]) -> Dict[Tuple[str, str], str]:
+        keys = [(row["external_id"], row["source_system"]) for row in chunk]
+        cached = [_vehicle_id_cache.get((organization_id,) + key) for key in keys]
+        # Still upserted (name / last_seen_at must be refreshed), but a
+        # fully cached chunk doesn't need the rows sent back
+        returning = (
+            ReturnMethod.minimal if all(cached) else ReturnMethod.representation
+        )
+        result = (
+            client.table("vehicles")
+            .upsert(
+                chunk,
+                on_conflict="organization_id,external_id,source_system",
+                returning=returning,
+            )
+            .execute()
+        )
+        if returning is ReturnMethod.representation and not result.data:
+            raise RuntimeError("upsert returned no data — check RLS/policies")
+        chunk_ids = {key: vid for key, vid in zip(keys, cached) if vid}
+        for v in result.data or []:
+            chunk_ids[(v["external_id"], v["source_system"])] = v["id"]
+        return chunk_ids
+
+    ids: Dict[Tuple[str, str], str] = {}
+    chunks = [chunk for rows in batches.values() for chunk in _chunks(rows)]
+    for chunk_ids in _map_chunks(upsert_chunk, chunks):
+        ids.update(chunk_ids)
+
+    for key, vid in ids.items():
+        _vehicle_id_cache[(organization_id,) + key] = vid
+    return ids
 
 
 def insert_position(
@@ -169,7 +350,7 @@ def insert_position(
     or the latest_vehicle_positions view handles job assignment.
     """
     client = get_client()
-    ts_dt = _ensure_datetime_utc(timestamp_utc)
+    ts_dt = ensure_datetime_utc(timestamp_utc)
 
     data = {
         "organization_id": organization_id,
@@ -189,6 +370,52 @@ def insert_position(
     ).execute()
 
 
+def insert_positions_bulk(
+    organization_id: str,
+    rows: List[Dict[str, Any]],
+) -> int:
+    """
+    Bulk version of insert_position: upsert the latest position for many
+    vehicles in one request per BULK_CHUNK_SIZE rows.
+
+    Each row is a dict with vehicle_id, latitude, longitude, heading,
+    speed_kph, odometer_km, timestamp_utc and (optionally) source_raw.
+    If a vehicle_id appears more than once, the last row wins, as it would
+    with repeated insert_position calls.
+
+    Returns the number of positions written.
+    """
+    if not rows:
+        return 0
+
+    client = get_client()
+
+    by_vehicle: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        by_vehicle[row["vehicle_id"]] = {
+            "organization_id": organization_id,
+            "vehicle_id": row["vehicle_id"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "heading": row.get("heading"),
+            "speed_kph": row.get("speed_kph"),
+            "odometer_km": row.get("odometer_km"),
+            "timestamp_utc": ensure_datetime_utc(row["timestamp_utc"]).isoformat(),
+            "source_raw": row.get("source_raw"),
+        }
+
+    # Upsert in BULK_CHUNK_SIZE batches, based on vehicle_id unique constraint.
+    # The written rows (source_raw included) aren't needed back.
+    def upsert_chunk(chunk: List[Dict[str, Any]]) -> None:
+        client.table("vehicle_positions").upsert(
+            chunk, on_conflict="vehicle_id", returning=ReturnMethod.minimal
+        ).execute()
+
+    _map_chunks(upsert_chunk, list(_chunks(list(by_vehicle.values()))))
+
+    return len(by_vehicle)
+
+
 def get_latest_positions(organization_id: Optional[str] = None) -> list[dict]:
     """
     Read from the latest_vehicle_positions view.
@@ -231,33 +458,63 @@ def delete_stale_vehicles(organization_id: str, stale_days: int = 7) -> int:
     # Calculate cutoff timestamp
     cutoff = (datetime.now(timezone.utc) - timedelta(days=stale_days)).isoformat()
 
-    # First, get the vehicles to be deleted (for count and logging)
-    stale_result = (
+    # Delete stale vehicles (positions auto-deleted via CASCADE); the deleted
+    # rows come back in the same request for the count and logging
+    result = (
         client.table("vehicles")
-        .select("id, name, external_id, source_system")
+        .delete(returning=ReturnMethod.representation)
         .eq("organization_id", organization_id)
         .lt("last_seen_at", cutoff)
         .execute()
     )
 
-    stale_vehicles = stale_result.data or []
+    stale_vehicles = result.data or []
     delete_count = len(stale_vehicles)
 
     if delete_count > 0:
-        # Log which vehicles are being deleted
+        invalidate_vehicle_cache(organization_id)
+        # Log which vehicles were deleted
         for v in stale_vehicles:
             print(f"  Removing stale vehicle: {v['name']} ({v['source_system']}/{v['external_id']})")
 
-        # Delete stale vehicles (positions auto-deleted via CASCADE)
-        client.table("vehicles") \
-            .delete() \
-            .eq("organization_id", organization_id) \
-            .lt("last_seen_at", cutoff) \
-            .execute()
-
     return delete_count
 
 
+def _validate_identifiers(
+    vehicle_id: Optional[str],
+    external_id: Optional[str],
+    name: Optional[str],
+    source_system: Optional[str],
+) -> None:
+    """Raise ValueError unless the arguments identify a vehicle (see delete_vehicle)."""
+    if not any([vehicle_id, external_id, name]):
+        raise ValueError("Must provide at least one of: vehicle_id, external_id, or name")
+
+    if external_id and not source_system:
+        raise ValueError("source_system is required when using external_id")
+
+
+def _apply_identifier_filter(
+    query,
+    vehicle_id: Optional[str],
+    external_id: Optional[str],
+    name: Optional[str],
+    source_system: Optional[str],
+):
+    """Narrow a vehicles query to the identified vehicle(s), most specific identifier first."""
+    if vehicle_id:
+        # Most specific: match by UUID
+        return query.eq("id", vehicle_id)
+    if external_id:
+        # Match by external_id + source_system
+        return query.eq("external_id", external_id).eq("source_system", source_system)
+    # Match by name (optionally filtered by source_system)
+    query = query.eq("name", name)
+    if source_system:
+        query = query.eq("source_system", source_system)
+    return query
+
+
 def delete_vehicle(
     organization_id: str,
     vehicle_id: Optional[str] = None,
@@ -284,30 +541,16 @@ def delete_vehicle(
     Note:
         vehicle_positions are automatically deleted via CASCADE constraint.
     """
-    if not any([vehicle_id, external_id, name]):
-        raise ValueError("Must provide at least one of: vehicle_id, external_id, or name")
-
-    if external_id and not source_system:
-        raise ValueError("source_system is required when using external_id")
+    _validate_identifiers(vehicle_id, external_id, name, source_system)
 
     client = get_client()
 
     # Build query
     query = client.table("vehicles").delete().eq("organization_id", organization_id)
-
-    if vehicle_id:
-        # Most specific: delete by UUID
-        query = query.eq("id", vehicle_id)
-    elif external_id:
-        # Delete by external_id + source_system
-        query = query.eq("external_id", external_id).eq("source_system", source_system)
-    else:
-        # Delete by name (optionally filtered by source_system)
-        query = query.eq("name", name)
-        if source_system:
-            query = query.eq("source_system", source_system)
+    query = _apply_identifier_filter(query, vehicle_id, external_id, name, source_system)
 
     result = query.execute()
+    invalidate_vehicle_cache(organization_id)
 
     # Check if any rows were deleted
     return result.data is not None and len(result.data) > 0
@@ -340,11 +583,7 @@ def soft_delete_vehicle(
     Raises:
         ValueError: If no identifier provided or invalid combination
     """
-    if not any([vehicle_id, external_id, name]):
-        raise ValueError("Must provide at least one of: vehicle_id, external_id, or name")
-
-    if external_id and not source_system:
-        raise ValueError("source_system is required when using external_id")
+    _validate_identifiers(vehicle_id, external_id, name, source_system)
 
     client = get_client()
 
@@ -357,17 +596,10 @@ def soft_delete_vehicle(
         .eq("organization_id", organization_id)
         .eq("is_deleted", False)  # Only update non-deleted vehicles
     )
-
-    if vehicle_id:
-        query = query.eq("id", vehicle_id)
-    elif external_id:
-        query = query.eq("external_id", external_id).eq("source_system", source_system)
-    else:
-        query = query.eq("name", name)
-        if source_system:
-            query = query.eq("source_system", source_system)
+    query = _apply_identifier_filter(query, vehicle_id, external_id, name, source_system)
 
     result = query.execute()
+    invalidate_vehicle_cache(organization_id)
 
     return len(result.data) if result.data else 0
 
@@ -392,11 +624,7 @@ def restore_vehicle(
     Returns:
         Number of vehicles restored
     """
-    if not any([vehicle_id, external_id, name]):
-        raise ValueError("Must provide at least one of: vehicle_id, external_id, or name")
-
-    if external_id and not source_system:
-        raise ValueError("source_system is required when using external_id")
+    _validate_identifiers(vehicle_id, external_id, name, source_system)
 
     client = get_client()
 
@@ -407,15 +635,7 @@ def restore_vehicle(
         .eq("organization_id", organization_id)
         .eq("is_deleted", True)  # Only update deleted vehicles
     )
-
-    if vehicle_id:
-        query = query.eq("id", vehicle_id)
-    elif external_id:
-        query = query.eq("external_id", external_id).eq("source_system", source_system)
-    else:
-        query = query.eq("name", name)
-        if source_system:
-            query = query.eq("source_system", source_system)
+    query = _apply_identifier_filter(query, vehicle_id, external_id, name, source_system)
 
     result = query.execute()
 
@@ -1,7 +1,7 @@
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
-from samsara_client import SAMSARA_BASE_URL, _get_headers
+from samsara_client import SAMSARA_BASE_URL, _SESSION, _get_headers
 
 # Use the same base URL and headers as your working code
 urlEq = f"{SAMSARA_BASE_URL}/fleet/equipment/locations"
@@ -14,12 +14,16 @@ params = {
     "limit": 200,   # ensure we get everything
 }
 
-respVeh = requests.get(urlVeh, headers=headers, params=params, timeout=30)
+# The three endpoints are independent, so fetch them concurrently over the
+# client's pooled session
+with ThreadPoolExecutor(3) as ex:
+    fVeh = ex.submit(_SESSION.get, urlVeh, headers=headers, params=params, timeout=30)
+    fEq = ex.submit(_SESSION.get, urlEq, headers=headers, params=params, timeout=30)
+    fAss = ex.submit(_SESSION.get, urlAss, headers=headers, params=params, timeout=30)
+respVeh, respEq, respAss = fVeh.result(), fEq.result(), fAss.result()
+
 print("Status:", respVeh.status_code)
-respEq = requests.get(urlEq, headers=headers, params=params, timeout=30)
 print("Status:", respEq.status_code)
-
-respAss = requests.get(urlAss, headers=headers, params=params, timeout=30)
 print("Status:", respAss.status_code)
 
 # If unauthorized or other error, show raw text and bail - VEHICLE
@@ -51,21 +55,15 @@ print("Count equipment returned:", len(assetsEq))
 
 print("Total assets: ", (len(assetsEq) + len(assetsVeh)))
 
-eqList = []
-
-for eq in assetsEq:
-    name = eq.get("name")
-    eqList.append(name)
-
-for veh in assetsVeh:
-    name = veh.get("name")
-    if name not in eqList:
-        eqList.append(name)
+eqList = [eq.get("name") for eq in assetsEq]
+seen = set(eqList)
 
-for ass in assetsAss:
-    name = ass.get("name")
-    if name not in eqList:
-        eqList.append(name)
+for src in (assetsVeh, assetsAss):
+    for x in src:
+        name = x.get("name")
+        if name not in seen:
+            seen.add(name)
+            eqList.append(name)
 
 print(f"total: {len(eqList)}")
 # for asset in assetsAss:
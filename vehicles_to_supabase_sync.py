@@ -12,26 +12,43 @@ from samsara_normalizer import normalize_location_record, dedupe_normalized_loca
 from cat_client import fetch_cat_positions
 
 from supabase_db import (
-    upsert_vehicle,
-    insert_position,
+    parse_iso,
+    upsert_vehicles_bulk,
+    insert_positions_bulk,
 )
+import direct_pg
+
+# Above this many positions, write them over a direct Postgres connection
+# (when SUPABASE_DB_URL is set) instead of the REST API
+DIRECT_PG_MIN_ROWS = 100
 
 # GAME Inc organization ID in ForeSyt
 ORGANIZATION_ID = "04d92433-6958-4b6c-a0fb-68d59fca8104"
 
 
-def is_position_fresh(timestamp_utc, max_age_hours: int = POSITION_FRESHNESS_HOURS) -> bool:
+def is_position_fresh(
+    timestamp_utc,
+    max_age_hours: int = POSITION_FRESHNESS_HOURS,
+    cutoff: Optional[datetime] = None,
+) -> bool:
     """
     Check if a position timestamp is fresh (within max_age_hours of now).
     Returns False for stale positions that should be skipped.
+
+    Pass a precomputed `cutoff` when checking many records so "now" is
+    taken once per sync rather than per record.
     """
     if timestamp_utc is None:
         return False
 
     try:
-        # Parse the timestamp if it's a string
+        # Parse the timestamp if it's a string. Samsara/CAT send RFC 3339, which
+        # parse_iso handles directly; dateutil only covers odd formats
         if isinstance(timestamp_utc, str):
-            ts = dt_parser.parse(timestamp_utc)
+            try:
+                ts = parse_iso(timestamp_utc)
+            except ValueError:
+                ts = dt_parser.parse(timestamp_utc)
         else:
             ts = timestamp_utc
 
@@ -40,7 +57,8 @@ def is_position_fresh(timestamp_utc, max_age_hours: int = POSITION_FRESHNESS_HOU
             ts = ts.replace(tzinfo=timezone.utc)
 
         # Check if within threshold
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+        if cutoff is None:
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
         return ts >= cutoff
     except Exception:
         return False
@@ -58,34 +76,22 @@ def run_sync_once():
     print(f"Fetched {len(equipment_raw)} equipment locations (v2).")
     print(f"Fetched {len(assets_v1_raw)} assets (v1).")
 
-    skipped_normalize = 0
-    normalized = []
-
-    # Vehicles (v2)
-    for item in vehicles_raw:
-        rec = normalize_location_record(item, category="vehicles_v2")
-        if rec:
-            normalized.append(rec)
-        else:
-            skipped_normalize += 1
-
-    # Equipment (v2)
-    for item in equipment_raw:
-        rec = normalize_location_record(item, category="equipment_v2")
-        if rec:
-            normalized.append(rec)
-        else:
-            skipped_normalize += 1
-        
-    # Assets (v1)
-    for item in assets_v1_raw:
-        rec = normalize_location_record(item, category="assets_v1")
-        if rec:
-            normalized.append(rec)
-        else:
-            skipped_normalize += 1
-
-    cat_records = fetch_cat_positions()
+    # Normalize vehicles (v2), equipment (v2) and assets (v1) in one pass
+    sources = [
+        ("vehicles_v2", vehicles_raw),
+        ("equipment_v2", equipment_raw),
+        ("assets_v1", assets_v1_raw),
+    ]
+    normalized = [
+        rec
+        for category, items in sources
+        for item in items
+        if (rec := normalize_location_record(item, category=category))
+    ]
+    skipped_normalize = sum(len(items) for _, items in sources) - len(normalized)
+
+    # keep_raw: the payload is stored in vehicle_positions.source_raw
+    cat_records = fetch_cat_positions(keep_raw=True)
     normalized.extend(cat_records)
 
     print("Samsara Normalized total:", len(normalized))
@@ -98,52 +104,54 @@ def run_sync_once():
     print(f"After dedupe: {len(deduped)} records "
           f"(removed {len(normalized) - len(deduped)} duplicates)")
 
+    if not deduped:
+        print("Nothing to sync.")
+        return
+
     # 4. Filter out stale positions (equipment removed from fleet but still returned by API)
-    fresh_records = []
-    stale_records = []
-    for rec in deduped:
-        if is_position_fresh(rec.get("timestamp_utc")):
-            fresh_records.append(rec)
-        else:
-            stale_records.append(rec)
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=POSITION_FRESHNESS_HOURS)
+    is_fresh = [is_position_fresh(rec.get("timestamp_utc"), cutoff=cutoff) for rec in deduped]
+    fresh_records = [rec for rec, fresh in zip(deduped, is_fresh) if fresh]
+    stale_records = [rec for rec, fresh in zip(deduped, is_fresh) if not fresh]
 
     if stale_records:
         print(f"Skipping {len(stale_records)} record(s) with stale positions (>{POSITION_FRESHNESS_HOURS}h old):")
         for rec in stale_records:
             print(f"  - {rec['name']} (last position: {rec.get('timestamp_utc')})")
 
-    # 5. Write to Supabase (upsert + insert positions)
-    inserted_positions = 0
+    if not fresh_records:
+        print("Nothing fresh to sync.")
+        return
+
+    # 5. Write to Supabase (upsert vehicles, then insert positions, one batch each)
+    vehicle_ids = upsert_vehicles_bulk(ORGANIZATION_ID, fresh_records)
+
+    position_rows = []
     skipped_deleted = 0
 
     for rec in fresh_records:
-        vehicle_id = upsert_vehicle(
-            organization_id=ORGANIZATION_ID,
-            external_id=rec["external_id"],
-            source_system=rec["source_system"],
-            name=rec["name"],
-            vtype=rec.get("vehicle_type"),
-        )
-
-        # upsert_vehicle returns None if vehicle is soft-deleted (blocklisted)
+        # Soft-deleted (blocklisted) vehicles have no id in the result
+        vehicle_id = vehicle_ids.get((rec["external_id"], rec["source_system"]))
         if vehicle_id is None:
             skipped_deleted += 1
             continue
 
         # job_id is assigned by refresh_vehicle_positions() or calculated by view
-        insert_position(
-            organization_id=ORGANIZATION_ID,
-            vehicle_id=vehicle_id,
-            lat=rec["latitude"],
-            lon=rec["longitude"],
-            heading=None,
-            speed_kph=rec["speed_kph"],
-            odometer_km=None,
-            timestamp_utc=rec["timestamp_utc"],
-            source_raw=rec["raw"],
-        )
-
-        inserted_positions += 1
+        position_rows.append({
+            "vehicle_id": vehicle_id,
+            "latitude": rec["latitude"],
+            "longitude": rec["longitude"],
+            "heading": None,
+            "speed_kph": rec["speed_kph"],
+            "odometer_km": None,
+            "timestamp_utc": rec["timestamp_utc"],
+            "source_raw": rec["raw"],
+        })
+
+    if direct_pg.is_configured() and len(position_rows) > DIRECT_PG_MIN_ROWS:
+        inserted_positions = direct_pg.insert_positions_bulk(ORGANIZATION_ID, position_rows)
+    else:
+        inserted_positions = insert_positions_bulk(ORGANIZATION_ID, position_rows)
 
     print(f"Inserted {inserted_positions} positions into Supabase.")
     if skipped_deleted > 0: